@@ -1,22 +1,28 @@
 #! usr/bin/env python3
 
 import argparse
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
-from functools import cached_property
+import gzip
+import heapq
 import http.client
-import json
+import io
+import itertools
 import pathlib
-import queue
 import re
+import sqlite3
 import sys
-from threading import Thread
+import threading
 import time
 from typing import Optional, Iterable, Callable
-import unidiff
 import urllib.error
 from urllib.parse import urlparse, parse_qs
-import urllib.request
+
+try:
+    import orjson as json  # considerably faster for the large paginated results, if installed
+except ImportError:
+    import json
 
 
 GITHUB_TOKEN = ""
@@ -29,118 +35,333 @@ class PullRequest:
     author: str
     title: str
     api_url: str
-    changes: Optional[unidiff.PatchSet] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ChangeStats:
     additions: int = 0
     deletions: int = 0
 
     def __lt__(self, other):
-        return (self.additions + self.deletions, self.additions) < (other.additions + other.deletions, other.additions)
+        # same as comparing (total, additions) tuples, without creating them
+        total = self.additions + self.deletions
+        other_total = other.additions + other.deletions
+        return total < other_total or (total == other_total and self.additions < other.additions)
     
     def __str__(self):
         return f"(+{self.additions}, -{self.deletions})"
     
 
-@dataclass(eq=False)
+@dataclass(eq=False, slots=True)
 class UserStatistics:
     pull_requests: int = 0
+    additions: int = 0
+    deletions: int = 0
     files_touched: dict[str, ChangeStats] = field(default_factory=lambda: defaultdict(ChangeStats))
 
-    @cached_property
+    @property
     def total_changes(self):
-        result = ChangeStats()
-        for stat in self.files_touched.values():
-            result.additions += stat.additions
-            result.deletions += stat.deletions
-        return result
+        return ChangeStats(self.additions, self.deletions)
     
     def __lt__(self, other):
-        return (self.total_changes, self.pull_requests) < (other.total_changes, other.pull_requests)
+        # same as comparing (total_changes, pull_requests) tuples, without creating them
+        total = self.additions + self.deletions
+        other_total = other.additions + other.deletions
+        if total != other_total:
+            return total < other_total
+        if self.additions != other.additions:
+            return self.additions < other.additions
+        return self.pull_requests < other.pull_requests
+
+
+@dataclass
+class ApiResponse:
+    headers: http.client.HTTPMessage
+    body: bytes
+
+
+# Stores response bodies with their ETag / Last-Modified validators, so that unchanged resources can be revalidated
+# with a conditional request on later runs. "304 Not Modified" responses don't count against the rate limit.
+class ResponseCache:
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # each stored response is its own transaction, WAL with synchronous=NORMAL avoids an fsync for each of them
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT NOT NULL,
+                    content_type TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    headers BLOB NOT NULL,
+                    body BLOB NOT NULL,
+                    PRIMARY KEY (url, content_type)
+                )
+            """)
+
+    def lookup(self, uri: str, content_type: str) -> Optional[tuple[Optional[str], Optional[str], ApiResponse]]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, headers, body FROM responses WHERE url = ? AND content_type = ?",
+                (uri, content_type),
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, headers, body = row
+        return etag, last_modified, ApiResponse(http.client.parse_headers(io.BytesIO(headers)), gzip.decompress(body))
+
+    def store(self, uri: str, content_type: str, headers: http.client.HTTPMessage, gzipped_body: bytes) -> None:
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag is None and last_modified is None:
+            return
+        # not using .as_bytes(), as it folds long lines (i.e. "Link")
+        serialized_headers = "".join(f"{name}: {value}\r\n" for (name, value) in headers.items()).encode("iso-8859-1") + b"\r\n"
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (uri, content_type, etag, last_modified, serialized_headers, gzipped_body),
+            )
+
+
+RESPONSE_CACHE: Optional[ResponseCache] = None
+
+thread_local_connections = threading.local()
+
+# A stalled connection must not keep its worker thread, and thus the exit (see requests_aborted), waiting forever
+REQUEST_TIMEOUT_SECONDS = 60
+
+# Set by abort_requests() when the main thread stops waiting for requests, e.g. on Ctrl+C / KeyboardInterrupt.
+# ThreadPoolExecutor workers are joined at interpreter exit, and the pool can't be shut down without waiting for its
+# running requests, so these must not keep sleeping for the rate limit or waiting for a free request slot.
+requests_aborted = threading.Event()
+
+
+class RequestsAborted(Exception):
+    pass
+
+
+def connection_for_host(host: str) -> http.client.HTTPSConnection:
+    # One keep-alive connection per worker thread and host, so each request doesn't pay for a new TCP + TLS handshake
+    if not hasattr(thread_local_connections, "by_host"):
+        thread_local_connections.by_host = {}
+    if host not in thread_local_connections.by_host:
+        thread_local_connections.by_host[host] = http.client.HTTPSConnection(host, timeout=REQUEST_TIMEOUT_SECONDS)
+    return thread_local_connections.by_host[host]
+
+
+def is_gzipped(response: http.client.HTTPResponse) -> bool:
+    return response.headers.get("Content-Encoding") == "gzip"
+
+
+# Returns the body as received, i.e. still gzipped if is_gzipped(response), so the cache can store it without compressing again
+def send_request(uri: str, headers: dict[str, str]) -> tuple[http.client.HTTPResponse, bytes]:
+    parsed_uri = urlparse(uri)
+    path = parsed_uri.path + (f"?{parsed_uri.query}" if parsed_uri.query else "")
+    connection = connection_for_host(parsed_uri.netloc)
+
+    try:
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+    except TimeoutError:  # the connection didn't go stale, the server didn't answer in time
+        raise
+    except (http.client.HTTPException, OSError):
+        # the server may have closed the idle keep-alive connection, retry once on a fresh one. A dead TLS connection can
+        # also fail with ssl.SSLError, which isn't a ConnectionError.
+        connection.close()
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+
+
+# When one request hits the rate limit, all other threads pause as well instead of each running into it on their own.
+# This keeps a high number of parallel requests from producing a burst of failing requests.
+rate_limit_lock = threading.Lock()
+rate_limited_until = 0.0
+
+
+def rate_limit_reset_time(headers: http.client.HTTPMessage) -> float:
+    # https://docs.github.com/en/rest/using-the-rest-api/rate-limits-for-the-rest-api?apiVersion=2022-11-28#exceeding-the-rate-limit
+    if "Retry-After" in headers:  # secondary rate limits
+        return time.time() + int(headers["Retry-After"])
+    if "x-ratelimit-reset" in headers:
+        return int(headers["x-ratelimit-reset"]) + 0.1
+    return time.time() + 60
+
+
+def pause_until_rate_limit_reset(headers: http.client.HTTPMessage) -> None:
+    global rate_limited_until
+    with rate_limit_lock:
+        reset_time = max(time.time() + 0.3, rate_limit_reset_time(headers))
+        if reset_time > rate_limited_until:
+            # with Retry-After, the requests that ran into the same limit each extend the pause by a few milliseconds
+            already_paused = rate_limited_until > time.time()
+            rate_limited_until = reset_time
+        else:
+            already_paused = True
+        if not already_paused:
+            limit = f" of {headers['x-ratelimit-limit']} requests" if "x-ratelimit-limit" in headers else ""
+            print(f"Hit rate limit{limit}. "
+                  + f"Sleeping for {(reset_time - time.time()):.2f} seconds"
+                  # + f" (until {headers['x-ratelimit-reset']}, current time {time.time()})"
+                  + ". Use authorization to prevent this.",
+                  file=sys.stderr)
+    wait_for_rate_limit_reset()
+
+
+def wait_for_rate_limit_reset() -> None:
+    if requests_aborted.wait(max(0.0, rate_limited_until - time.time())):
+        raise RequestsAborted()
+
+
+# Additive increase / multiplicative decrease of the number of requests in flight: While more than half of the rate limit
+# is left, each successful response allows one more parallel request, up to the maximum. A rejected request halves it.
+class AdaptiveConcurrencyLimit:
+    def __init__(self, initial: int, maximum: int):
+        self.condition = threading.Condition()
+        self.limit = min(initial, maximum)
+        self.maximum = maximum
+        self.in_flight = 0
+
+    def __enter__(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight < self.limit or requests_aborted.is_set())
+            if requests_aborted.is_set():
+                raise RequestsAborted()
+            self.in_flight += 1
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def wake_all(self) -> None:
+        with self.condition:
+            self.condition.notify_all()
+
+    def adjust(self, response: http.client.HTTPResponse) -> None:
+        with self.condition:
+            if response.status in (403, 429):
+                self.limit = max(1, self.limit // 2)
+                return
 
+            remaining = response.headers.get("x-ratelimit-remaining")
+            rate_limit = response.headers.get("x-ratelimit-limit")
+            if remaining is not None and rate_limit is not None and int(remaining) > int(rate_limit) / 2:
+                self.limit = min(self.maximum, self.limit + 1)
+                self.condition.notify()
 
-def response_for_api_path(uri: str, content_type: str = "application/vnd.github+json") -> http.client.HTTPResponse:
-    request = urllib.request.Request(uri)
-    request.add_header("Accept", content_type)
-    request.add_header("X-GitHub-Api-Version", "2022-11-28")
+
+CONCURRENCY_LIMIT: Optional[AdaptiveConcurrencyLimit] = None  # set from --num-parallel-requests
+
+
+def abort_requests(futures: Iterable[Future]) -> None:
+    # Drops the requests that didn't start yet and makes running ones stop at their next rate limit or concurrency wait
+    requests_aborted.set()
+    for future in futures:
+        future.cancel()
+    if CONCURRENCY_LIMIT:
+        CONCURRENCY_LIMIT.wake_all()
+
+
+def response_for_api_path(uri: str, content_type: str = "application/vnd.github+json") -> ApiResponse:
+    headers = {
+        "Accept": content_type,
+        "Accept-Encoding": "gzip",  # diffs and JSON compress well
+        "User-Agent": "github-fame",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
     if GITHUB_TOKEN:
-        request.add_header("Authorization", f"Bearer {GITHUB_TOKEN}")
+        headers["Authorization"] = f"Bearer {GITHUB_TOKEN}"
 
     while True:
-        try:
-            return urllib.request.urlopen(request)
-        except urllib.error.HTTPError as e:
-            if e.code == 403:  # rate limit exceeded
-                sleep_time = max(0.3, int(e.headers["x-ratelimit-reset"]) - time.time() + 0.1)
-                print(f"Hit rate limit of {e.headers['x-ratelimit-limit']} requests. "
-                      + f"Sleeping for {sleep_time:.2f} seconds"
-                      # + f" (until {e.headers['x-ratelimit-reset']}, current time {time.time()})"
-                      + ". Use authorization to prevent this.",
-                      file=sys.stderr)
-                time.sleep(sleep_time)
-                continue
-            raise
+        cached = RESPONSE_CACHE.lookup(uri, content_type) if RESPONSE_CACHE else None
+        if cached:
+            etag, last_modified, cached_response = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        wait_for_rate_limit_reset()
+        with CONCURRENCY_LIMIT:
+            response, raw_body = send_request(uri, headers)
+        CONCURRENCY_LIMIT.adjust(response)
+
+        if response.status == 304 and cached:
+            return cached_response
+
+        if 200 <= response.status < 300:
+            body = gzip.decompress(raw_body) if is_gzipped(response) else raw_body
+            if RESPONSE_CACHE:
+                RESPONSE_CACHE.store(uri, content_type, response.headers, raw_body if is_gzipped(response) else gzip.compress(body))
+            return ApiResponse(response.headers, body)
+
+        if response.status in (301, 302, 307, 308):  # e.g. renamed repositories
+            uri = response.headers["Location"]
+            headers.pop("If-None-Match", None)
+            headers.pop("If-Modified-Since", None)
+            continue
+
+        if response.status in (403, 429):  # rate limit exceeded
+            pause_until_rate_limit_reset(response.headers)
+            continue
+
+        raise urllib.error.HTTPError(uri, response.status, response.reason, response.headers, None)
+
+
+def last_page_from_link_header(response: ApiResponse) -> int:
+    # https://docs.github.com/en/rest/guides/using-pagination-in-the-rest-api?apiVersion=2022-11-28
+    if "Link" not in response.headers:
+        return 1
+    link_headers = {match[1]: match[0] for match in re.findall(r"\<(.+?)\>; rel=\"(prev|next|last|first)\"", response.headers["Link"])}
+    last_uri = link_headers["last"]
+    return int(parse_qs(urlparse(last_uri).query)["page"][0])
 
 
-def collect_paginated_json_results(base_uri: str, response_to_result_items: Callable[[object], list], num_threads: int) -> list:
-    response = response_for_api_path(base_uri)
+def page_count(result_count: int, per_page: int = 100) -> int:
+    return max(1, -(-result_count // per_page))
 
-    # https://docs.github.com/en/rest/guides/using-pagination-in-the-rest-api?apiVersion=2022-11-28
-    last_page = 1
-    if "Link" in response.headers:
-        link_headers = {match[1]: match[0] for match in re.findall(r"\<(.+?)\>; rel=\"(prev|next|last|first)\"", response.headers["Link"])}
-        last_uri = link_headers["last"]
-        last_page = int(parse_qs(urlparse(last_uri).query)["page"][0])
 
-    print(f"Collecting paginated result, requires {last_page - 1} more requests, using {num_threads} parallel connections: ")
+def collect_paginated_json_results(base_uri: str, last_page: int, response_to_result_items: Callable[[object], list], executor: ThreadPoolExecutor) -> list:
+    # The number of pages is known up front, so all pages can be requested at once
+    def fetch_page(page: int) -> object:
+        response = response_for_api_path(base_uri + f"&page={page}")
+        return json.loads(response.body)
 
-    parsed_pages = [None] * last_page
-    parsed_pages[0] = json.loads(response.read())
+    print(f"Collecting paginated result, requires {last_page} requests: ")
 
-    page_queue = queue.Queue()
-    for page in range(2, last_page + 1):
-        page_queue.put(page)
+    parsed_pages = [None] * last_page
 
-    def thread_function():
-        while True:
-            try:
-                page = page_queue.get(block=False)
-            except queue.Empty:
-                return
-            
-            response = response_for_api_path(base_uri + f"&page={page}")
-            parsed_pages[page - 1] = json.loads(response.read())
+    future_to_page = {executor.submit(fetch_page, page): page for page in range(1, last_page + 1)}
+    try:
+        for future in as_completed(future_to_page):
+            parsed_pages[future_to_page[future] - 1] = future.result()
             print(".", end="", flush=True)
-            page_queue.task_done()
-    
-    for _ in range(num_threads):
-        Thread(target=thread_function, daemon=True).start()
+    except BaseException:  # including Ctrl+C / KeyboardInterrupt
+        abort_requests(future_to_page)
+        raise
 
-    # not immediately using .join() as it blocks Ctrl+C / KeyboardInterrupt from exiting the program.
-    while not page_queue.empty():
-        time.sleep(0.1)
-    page_queue.join()
-
-    results = []
-    for parsed_page in parsed_pages:
-        results.extend(response_to_result_items(parsed_page))
+    results = list(itertools.chain.from_iterable(response_to_result_items(parsed_page) for parsed_page in parsed_pages))
     
     print("\nDone\n")
 
     return results
 
 
-def get_pull_requests_using_search(repo: str, num_threads: int, filter_author: Optional[str] = None) -> list[PullRequest]:
+def get_pull_requests_using_search(repo: str, executor: ThreadPoolExecutor, filter_author: Optional[str] = None) -> list[PullRequest]:
     def get_search_link(per_page: int = 100):
         uri = f"https://api.github.com/search/issues?per_page={per_page}&q=is:pr+repo:{repo}"
         if filter_author:
             uri += f"+author:{filter_author}"
         return uri
 
-    probe_result_count_response = urllib.request.urlopen(get_search_link(1))
-    result_count = json.loads(probe_result_count_response.read())["total_count"]
+    probe_result_count_response = response_for_api_path(get_search_link(1))
+    result_count = json.loads(probe_result_count_response.body)["total_count"]
     if result_count > 1000:
         raise RuntimeError(f"GitHub reported {result_count} results, but the search API will only retrieve the first 1000 results.")
 
@@ -155,13 +376,20 @@ def get_pull_requests_using_search(repo: str, num_threads: int, filter_author: O
         ]
     
     print(f"Getting pull requests for {repo} using GitHub's search API")
-    pull_request_list = collect_paginated_json_results(get_search_link(), response_to_result_items, num_threads)
+    pull_request_list = collect_paginated_json_results(get_search_link(), page_count(result_count), response_to_result_items, executor)
     pull_requests_by_id = {pr.id: pr for pr in pull_request_list}   # to ensure no duplicates due to new PRs while traversing pages
     return list(pull_requests_by_id.values())
 
 
-def get_pull_requests_using_pulls(repo: str, num_threads: int) -> list[PullRequest]:
-    uri = f"https://api.github.com/repos/{repo}/pulls?state=all&per_page=100"
+def get_pull_requests_using_pulls(repo: str, executor: ThreadPoolExecutor) -> list[PullRequest]:
+    def get_pulls_link(per_page: int = 100):
+        return f"https://api.github.com/repos/{repo}/pulls?state=all&per_page={per_page}"
+
+    # The pulls API doesn't report a total count, but with one result per page, the last page number is the count
+    probe_result_count_response = response_for_api_path(get_pulls_link(1))
+    result_count = last_page_from_link_header(probe_result_count_response)
+    if result_count == 1:
+        result_count = len(json.loads(probe_result_count_response.body))
 
     def response_to_result_items(json_object: object) -> list[PullRequest]:
         return [PullRequest(
@@ -174,67 +402,206 @@ def get_pull_requests_using_pulls(repo: str, num_threads: int) -> list[PullReque
         ]
 
     print(f"Getting pull requests for {repo} using GitHub's pulls API")
-    pull_request_list = collect_paginated_json_results(uri, response_to_result_items, num_threads)
+    pull_request_list = collect_paginated_json_results(get_pulls_link(), page_count(result_count), response_to_result_items, executor)
     pull_requests_by_id = {pr.id: pr for pr in pull_request_list}   # to ensure no duplicates due to new PRs while traversing pages
     return list(pull_requests_by_id.values())
 
 
-def annotate_changes(pull_request: PullRequest) -> None:
+DIFF_GIT_HEADER_RE = re.compile(rb'diff --git "?a/(.*?)"? "?b/(.*?)"?$')
+
+
+def count_changes_per_file(diff: bytes, encoding: str) -> list[tuple[str, int, int]]:
+    # Only the per-file line counts are needed, so instead of parsing the diff line by line, this only locates file headers
+    # and the first hunk of each file, and counts added / removed lines of all hunks at once with bytes.count(), in C.
+    # Hunk content lines always start with " ", "+", "-" or "\\", so they can't be mistaken for "diff --git" or "@@" lines.
+    file_stats = []
+
+    file_start = diff.find(b"diff --git ")
+    while file_start != -1:
+        next_file_start = diff.find(b"\ndiff --git ", file_start)
+        file_end = len(diff) if next_file_start == -1 else next_file_start + 1
+
+        header_end = diff.find(b"\n", file_start, file_end)
+        if header_end == -1:
+            header_end = file_end
+        first_hunk_start = diff.find(b"\n@@ ", header_end - 1, file_end)
+        hunks_start = file_end if first_hunk_start == -1 else first_hunk_start
+
+        # The extended header lines before the first hunk tell whether the file was added or renamed
+        match = DIFF_GIT_HEADER_RE.match(diff, file_start, header_end)
+        if (diff.find(b"\n--- /dev/null\n", header_end, hunks_start + 1) != -1
+                or diff.find(b"\nrename to ", header_end, hunks_start) != -1):
+            path = match[2].decode(encoding, "replace")
+        else:
+            path = match[1].decode(encoding, "replace")
+
+        added = diff.count(b"\n+", hunks_start, file_end)
+        removed = diff.count(b"\n-", hunks_start, file_end)
+        file_stats.append((path, added, removed))
+
+        file_start = -1 if next_file_start == -1 else next_file_start + 1
+
+    return file_stats
+
+
+def get_changes_per_file(pull_request: PullRequest) -> list[tuple[str, int, int]]:
     diff_response = response_for_api_path(pull_request.api_url, content_type="application/vnd.github.diff")
-    diff_response_encoding = diff_response.headers.get_charsets()[0]
-    pull_request.changes = unidiff.PatchSet(diff_response, encoding=diff_response_encoding)
+    diff_response_encoding = diff_response.headers.get_charsets()[0] or "utf-8"
+    return count_changes_per_file(diff_response.body, diff_response_encoding)
+
 
+def get_changes_per_file_from_file_list(pull_request: PullRequest) -> Optional[list[tuple[str, int, int]]]:
+    # The file list has the per-file counts as well, but leaves out the patches of large files. So for pull requests that
+    # e.g. update lock files, it's much smaller than the diff. Returns None for pull requests with more than one page of
+    # files, their diff is retrieved instead.
+    response = response_for_api_path(pull_request.api_url + "/files?per_page=100")
+    if "Link" in response.headers:
+        return None
+    return [(file["filename"], file["additions"], file["deletions"]) for file in json.loads(response.body)]
 
-def annotate_changes_parallel(pull_requests: Iterable[PullRequest], num_threads: int) -> None:
-    print(f"Getting changes for {len(pull_requests)} pull requests using {num_threads} parallel connections:")
 
-    pull_request_queue = queue.Queue()
-    for pull_request in pull_requests:
-        pull_request_queue.put(pull_request)
+def glob_char_set_to_regex(char_set: str) -> str:
+    # Translates the content of a "[...]" glob like fnmatch.translate() does: Reversed ranges like "z-a" match nothing, and
+    # characters with a special meaning in regex sets are escaped
+    negated = char_set.startswith("!")
+    if negated:
+        char_set = char_set[1:]
 
-    def thread_function():
+    if "-" not in char_set:
+        chunks = [char_set]
+    else:
+        # split at hyphens that form ranges, a hyphen at the start or directly after a range is literal
+        chunks = []
+        chunk_start = 0
+        hyphen = 1
         while True:
-            try:
-                pr = pull_request_queue.get(block=False)
-            except queue.Empty:
-                return
-            annotate_changes(pr)
-            print(".", end="", flush=True)
-            pull_request_queue.task_done()
-    
-    for _ in range(num_threads):
-        Thread(target=thread_function, daemon=True).start()
+            hyphen = char_set.find("-", hyphen)
+            if hyphen < 0:
+                break
+            chunks.append(char_set[chunk_start:hyphen])
+            chunk_start = hyphen + 1
+            hyphen = hyphen + 3
+        last_chunk = char_set[chunk_start:]
+        if last_chunk:
+            chunks.append(last_chunk)
+        else:
+            chunks[-1] += "-"
+        # remove empty ranges, they are invalid in regexes
+        for index in range(len(chunks) - 1, 0, -1):
+            if chunks[index - 1][-1] > chunks[index][0]:
+                chunks[index - 1] = chunks[index - 1][:-1] + chunks[index][1:]
+                del chunks[index]
+
+    regex_set = "-".join(chunk.replace("\\", "\\\\").replace("-", "\\-") for chunk in chunks)
+    regex_set = re.sub(r"([&~|\[])", r"\\\1", regex_set)
+
+    if not regex_set:
+        return "[^/]" if negated else "(?!)"
+    if negated:
+        return f"(?!/)[^{regex_set}]"
+    if regex_set.startswith("^"):
+        regex_set = "\\" + regex_set
+    return f"(?!/)[{regex_set}]"
+
+
+def glob_part_to_regex(glob_part: str) -> str:
+    # like fnmatch.translate(), but wildcards don't match "/", so that the regex can be applied to whole paths
+    result = []
+    index = 0
+    while index < len(glob_part):
+        char = glob_part[index]
+        index += 1
+        if char == "*":
+            result.append("[^/]*")
+        elif char == "?":
+            result.append("[^/]")
+        elif char == "[":
+            end = index
+            if end < len(glob_part) and glob_part[end] == "!":
+                end += 1
+            if end < len(glob_part) and glob_part[end] == "]":
+                end += 1
+            end = glob_part.find("]", end)
+            if end == -1:
+                result.append(re.escape(char))
+                continue
+            result.append(glob_char_set_to_regex(glob_part[index:end]))
+            index = end + 1
+        else:
+            result.append(re.escape(char))
+    return "".join(result)
 
-    # not immediately using .join() as it blocks Ctrl+C / KeyboardInterrupt from exiting the program.
-    while not pull_request_queue.empty():
-        time.sleep(0.1)
-    pull_request_queue.join()
-    print("\nDone\n")
 
+def compile_exclude_globs(exclude_globs: list[str]) -> re.Pattern:
+    # One regex for all globs, with the semantics of pathlib.PurePath.match(): Relative globs are matched from the right,
+    # so "*.min.js" also matches "dist/app.min.js", absolute globs have to match the whole path.
+    if not exclude_globs:
+        return re.compile(r"(?!)")
+
+    glob_regexes = []
+    for glob in exclude_globs:
+        parts = [part for part in glob.split("/") if part not in ("", ".")]
+        prefix = "/" if glob.startswith("/") else "(?:.*/)?"
+        glob_regexes.append(prefix + "/".join(glob_part_to_regex(part) for part in parts))
+    return re.compile("(?s:" + "|".join(glob_regexes) + r")\Z")
 
-def build_statistics_per_user(pull_requests: Iterable[PullRequest], exclude_globs: list[str]) -> dict[str, UserStatistics]:
-    user_statistics: dict[str, UserStatistics] = defaultdict(UserStatistics)
-    for pull_request in pull_requests:
-        if args.verbose:
-            print(f"\nChecking #{pull_request.id} by {pull_request.author} ('{pull_request.title}')")
 
-        user_statistics[pull_request.author].pull_requests += 1
+def add_to_statistics(user_statistics: dict[str, UserStatistics], pull_request: PullRequest, file_stats: list[tuple[str, int, int]], exclude_re: re.Pattern) -> None:
+    if args.verbose:
+        print(f"\nChecking #{pull_request.id} by {pull_request.author} ('{pull_request.title}')")
 
-        for patched_file in pull_request.changes:
-            path = pathlib.PurePath(patched_file.path.strip('"'))
-            excluded = any(path.match(glob) for glob in exclude_globs)
+    statistics = user_statistics[pull_request.author]
+    statistics.pull_requests += 1
 
-            if excluded:
-                if args.verbose:
-                    print(f"Ignoring {path} (+{patched_file.added}, -{patched_file.removed})")
-                continue
-        
+    for (path, added, removed) in file_stats:
+        excluded = exclude_re.match(path) is not None
+
+        if excluded:
             if args.verbose:
-                print(f"Counting {path} (+{patched_file.added}, -{patched_file.removed})")
+                print(f"Ignoring {path} (+{added}, -{removed})")
+            continue
+    
+        if args.verbose:
+            print(f"Counting {path} (+{added}, -{removed})")
+
+        # Many users and pull requests touch the same files. Interning lets all files_touched dicts share one string per path
+        path = sys.intern(path)
+
+        # This handles renamed files correctly (as the diff doesn't show changes, just "rename from X" and "rename to Y")
+        file_changes = statistics.files_touched[path]
+        file_changes.additions += added
+        file_changes.deletions += removed
+        statistics.additions += added
+        statistics.deletions += removed
 
-            # This handles renamed files correctly (as the diff doesn't show changes, just "rename from X" and "rename to Y")
-            user_statistics[pull_request.author].files_touched[path].additions += patched_file.added
-            user_statistics[pull_request.author].files_touched[path].deletions += patched_file.removed
+
+def build_statistics_per_user(pull_requests: Iterable[PullRequest], exclude_globs: list[str], executor: ThreadPoolExecutor, check_file_list_first: bool = False) -> dict[str, UserStatistics]:
+    # Each diff is counted by the thread that retrieved it, so only its per-file counts are kept until the pull request is
+    # added to the statistics. They are added in list order, so the output doesn't depend on which request finishes first.
+    print(f"Getting changes for {len(pull_requests)} pull requests:")
+
+    user_statistics: dict[str, UserStatistics] = defaultdict(UserStatistics)
+    exclude_re = compile_exclude_globs(exclude_globs)
+
+    def get_changes(pull_request: PullRequest) -> list[tuple[str, int, int]]:
+        if check_file_list_first:
+            file_stats = get_changes_per_file_from_file_list(pull_request)
+            if file_stats is not None:
+                return file_stats
+        return get_changes_per_file(pull_request)
+
+    pending = deque((executor.submit(get_changes, pr), pr) for pr in pull_requests)
+    try:
+        while pending:
+            future, pull_request = pending.popleft()  # not kept after merging, so the counts can be freed
+            add_to_statistics(user_statistics, pull_request, future.result(), exclude_re)
+            if not args.verbose:
+                print(".", end="", flush=True)
+    except BaseException:  # including Ctrl+C / KeyboardInterrupt
+        abort_requests(future for (future, _) in pending)
+        raise
+
+    print("\nDone\n")
 
     return user_statistics
 
@@ -245,6 +612,8 @@ DEFAULT_EXCLUDE_GLOBS = [
     "*min.css",
 ]
 
+DEFAULT_CACHE_FILE = str(pathlib.Path.home() / ".cache" / "github-fame" / "responses.sqlite3")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Summarize contributions based on GitHub pull requests")
     parser.add_argument("repository", help="GitHub repo, in the form 'user/repo'")
@@ -253,14 +622,29 @@ if __name__ == "__main__":
     parser.add_argument("-d", "--disable-default-exclude-globs", help=f"do not apply the default exclusion globs ({DEFAULT_EXCLUDE_GLOBS})", action="store_true")
     parser.add_argument("-e", "--exclude-glob", nargs="*", action="extend", default=[], help="add globs for files to exclude")
     parser.add_argument("--exclude-pr", nargs="*", action="extend", type=int, help="exclude specific pull requests by their number from analysis")
+    parser.add_argument("--check-file-list-first", action="store_true", help="count changes using the list of changed files instead of the diff, which leaves out large files' patches. "
+                        + "Pull requests with more than 100 changed files need one more API request for their diff")
     parser.add_argument("-v", "--verbose", action="store_true", help="show detailed information about what changes are included")
-    parser.add_argument("-n", "--num-parallel-requests", default=10, help="number of parallel requests to retrieve pull request changes")
+    parser.add_argument("-n", "--num-parallel-requests", type=int, default=10, help="maximum number of parallel requests. Starts at half of it and is adapted based on the remaining rate limit")
     parser.add_argument("--include-unmerged", action="store_true", help="include unmerged pull requests")
+    parser.add_argument("--cache", action="store_true", help="cache API responses on disk to speed up repeated runs. "
+                        + "The responses are kept until the cache file is deleted, including data of private repositories fetched using --token")
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_FILE, help=f"file to cache API responses in when using --cache (default: {DEFAULT_CACHE_FILE})")
     args = parser.parse_args()
     
     if args.token:
         GITHUB_TOKEN = args.token
 
+    max_parallel_requests = max(1, args.num_parallel_requests)
+    CONCURRENCY_LIMIT = AdaptiveConcurrencyLimit(initial=max(1, max_parallel_requests // 2), maximum=max_parallel_requests)
+    # shared by all phases, so worker threads (and their keep-alive connections) are reused. Stopped via requests_aborted
+    executor = ThreadPoolExecutor(max_workers=max_parallel_requests, thread_name_prefix="github-fame")
+    print(f"Using up to {max_parallel_requests} parallel connections\n")
+
+    if args.cache:
+        pathlib.Path(args.cache_file).parent.mkdir(parents=True, exist_ok=True)
+        RESPONSE_CACHE = ResponseCache(args.cache_file)
+
     exclude_globs = [*args.exclude_glob]
     if not args.disable_default_exclude_globs:
         exclude_globs.extend(DEFAULT_EXCLUDE_GLOBS)
@@ -268,9 +652,9 @@ if __name__ == "__main__":
         print(f"Using exclude globs {exclude_globs}\n")
 
     if args.filter_author:
-        pull_requests = get_pull_requests_using_search(args.repository, args.filter_author, args.num_parallel_requests)
+        pull_requests = get_pull_requests_using_search(args.repository, executor, args.filter_author)
     else:
-        pull_requests = get_pull_requests_using_pulls(args.repository, args.num_parallel_requests)
+        pull_requests = get_pull_requests_using_pulls(args.repository, executor)
 
     if args.verbose:
         print(f"Found {len(pull_requests)} PRs: {[pr.id for pr in pull_requests]}\n")
@@ -292,8 +676,8 @@ if __name__ == "__main__":
         print(f"Ignoring {len(pull_requests) - len(filtered_pull_requests)} explicitly excluded pull requests\n")
         pull_requests = filtered_pull_requests
 
-    annotate_changes_parallel(pull_requests, args.num_parallel_requests)
-    user_statistics = build_statistics_per_user(pull_requests, exclude_globs)
+    user_statistics = build_statistics_per_user(pull_requests, exclude_globs, executor, args.check_file_list_first)
+    executor.shutdown()
 
     for (user, stats) in sorted(user_statistics.items(), key=lambda pair: pair[1], reverse=True):
         total_changes = stats.total_changes
@@ -301,12 +685,12 @@ if __name__ == "__main__":
               + f"Total changes: {total_changes}. "
               + f"Average per PR: (+{(total_changes.additions / stats.pull_requests):.1f}, -{(total_changes.deletions / stats.pull_requests):.1f})")
         
-        sorted_change_pairs = sorted(stats.files_touched.items(), key=lambda pair: pair[1], reverse=True)
         if args.verbose:
             print("Files changed:")
+            sorted_change_pairs = sorted(stats.files_touched.items(), key=lambda pair: pair[1], reverse=True)
         else:
-            print(f"Top 5 files changed (out of {len(sorted_change_pairs)}):")
-            sorted_change_pairs = sorted_change_pairs[0:5]
+            print(f"Top 5 files changed (out of {len(stats.files_touched)}):")
+            sorted_change_pairs = heapq.nlargest(5, stats.files_touched.items(), key=lambda pair: pair[1])
 
         for (path, changes) in sorted_change_pairs:
             print(f"    {path} {changes}")